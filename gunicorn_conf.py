@@ -0,0 +1,30 @@
+"""
+Gunicorn configuration for production deployments.
+
+Run with: gunicorn -c gunicorn_conf.py server:app
+"""
+import multiprocessing
+import os
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+
+if worker_class == "gevent":
+    # The app is preloaded in the master, so patch before it imports the OpenAI
+    # client (and ssl); gevent's worker would otherwise patch too late.
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_connections = 200
+
+# Requests spend seconds waiting on Gemini; only a stuck worker should hit this.
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# Load the app once in the master so workers share the initialized OpenAI client.
+preload_app = True
+
+accesslog = "-"
+errorlog = "-"
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
@@ -6,16 +6,63 @@ from werkzeug.utils import secure_filename
 import json
 import traceback
 import re
+import atexit
+import hashlib
+import inspect
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, wraps
+from cachetools import TTLCache
 from openai import OpenAI
-import PyPDF2
 from io import BytesIO
 
+try:
+    import pymupdf
+    MUPDF_SUPPORT = True
+except ImportError:
+    MUPDF_SUPPORT = False
+
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_SUPPORT = True
+except ImportError:
+    PDFIUM_SUPPORT = False
+
 try:
     import PyPDF2
-    PDF_SUPPORT = True
+    PYPDF2_SUPPORT = True
+except ImportError:
+    PYPDF2_SUPPORT = False
+
+PDF_SUPPORT = MUPDF_SUPPORT or PDFIUM_SUPPORT or PYPDF2_SUPPORT
+if not PDF_SUPPORT:
+    print("None of PyMuPDF, pypdfium2 or PyPDF2 installed. PDF extraction will be disabled. Install with: pip install pypdfium2")
+
+try:
+    from whitenoise import WhiteNoise
+    WHITENOISE_SUPPORT = True
+except ImportError:
+    WHITENOISE_SUPPORT = False
+
+try:
+    import orjson
+    ORJSON_SUPPORT = True
+except ImportError:
+    ORJSON_SUPPORT = False
+
+try:
+    import redis
+    REDIS_SUPPORT = True
+except ImportError:
+    REDIS_SUPPORT = False
+
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+    SEMANTIC_CACHE_SUPPORT = True
 except ImportError:
-    print("PyPDF2 not installed. PDF extraction will be disabled. Install with: pip install pypdf2")
-    PDF_SUPPORT = False
+    print("sentence-transformers not installed. Semantic caching will be disabled. Install with: pip install sentence-transformers")
+    SEMANTIC_CACHE_SUPPORT = False
 
 # Load environment variables
 load_dotenv()
@@ -38,29 +85,146 @@ app = Flask(__name__, static_folder="public")
 CORS(app)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024 
 
+# Static assets aren't fingerprinted, so keep browser caching short and rely on ETag revalidation
+STATIC_MAX_AGE_SECONDS = 3600
+
+if WHITENOISE_SUPPORT:
+    # Re-scan public/ on every request only under the dev server (python server.py).
+    app.wsgi_app = WhiteNoise(
+        app.wsgi_app,
+        root=os.path.join(app.root_path, "public"),
+        index_file=True,
+        max_age=STATIC_MAX_AGE_SECONDS,
+        autorefresh=__name__ == "__main__"
+    )
+
 # File upload configuration
-ALLOWED_EXTENSIONS = {"pdf", "txt"}
+ALLOWED_EXTENSIONS = frozenset({"pdf", "txt"})
 
 MAX_TEXT_SIZE_BYTES = 5 * 1024 * 1024 
+READ_CHUNK_SIZE = 64 * 1024
 MAX_API_CONTEXT_SIZE = 8000
 MAX_PDF_PAGES = 1000
+# Extra characters extracted past a file's budget, leaving room for the final trim
+EXTRACTION_SLACK_CHARS = 512
+CONTEXT_FULL_NOTE = "[Skipped, the content limit was already reached by earlier files.]"
+
+# LLM output cleanup patterns
+CODE_FENCE_RE = re.compile(r'```[a-zA-Z]*\s*')
+TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+# Smart quotes to ASCII, non-breaking spaces to spaces, and control characters dropped, in one pass
+JSON_CLEANUP_TABLE = str.maketrans({
+    '“': '"', '”': '"', '‘': "'", '’': "'",
+    '\xa0': ' ',
+    **{chr(c): None for c in [*range(0x00, 0x20), 0x7F]},
+})
+CONTENT_ARRAY_RE = re.compile(r'"content"\s*:\s*\[')
+JSON_DECODER = json.JSONDecoder()
+
+# LLM configuration
+GEMINI_MODEL = "gemini-2.5-flash-lite"
+SYSTEM_CONTENT = (
+    "You are an educational AI assistant. You MUST respond with ONLY valid, well-formed JSON, "
+    "and no other conversational text. Do NOT wrap the JSON in markdown backticks (```json). "
+    "For all mathematical or special symbols, such as square root, pi, or summation, "
+    "YOU MUST USE THE ACTUAL UNICODE SYMBOL (e.g., √, π, Σ) and NOT text shortcuts (like sqrt, pi, sum)."
+)
+STUDY_SET_MAX_TOKENS = 3200
+EXPLANATION_MAX_TOKENS = 1200
+QUIZ_MAX_TOKENS = 2000
+
+# LLM response cache configuration
+LLM_CACHE_MAXSIZE = 1024
+LLM_CACHE_TTL_SECONDS = 3600
+REDIS_URL = os.getenv("REDIS_URL")
+
+llm_cache = TTLCache(maxsize=LLM_CACHE_MAXSIZE, ttl=LLM_CACHE_TTL_SECONDS)
+llm_cache_lock = threading.Lock()
+llm_cache_stats = {"hits": 0, "misses": 0}
 
+redis_client = None
+if REDIS_URL and REDIS_SUPPORT:
+    try:
+        redis_client = redis.Redis.from_url(REDIS_URL)
+    except Exception as e:
+        print(f"Error initializing Redis client, falling back to in-process cache: {e}")
+        redis_client = None
+elif REDIS_URL:
+    print("REDIS_URL is set but redis is not installed. Using in-process cache. Install with: pip install redis")
+
+# Semantic cache configuration
+SEMANTIC_CACHE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_MAXSIZE = 1024
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "semantic_cache.npz")
+
+@lru_cache(maxsize=1024)
 def allowed_file(filename):
     """Checks if the file extension is one of the allowed types (pdf, txt)."""
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_text_from_file(file):
-    """Extract text from uploaded TXT or PDF file."""
-    filename = file.filename
+def open_pdf(file_data):
+    """
+    Opens a PDF from bytes or a seekable binary stream with the fastest available backend.
+    Returns (total_pages, page_text, close), where page_text(i) extracts the text of page i.
+    """
+    if MUPDF_SUPPORT:
+        pdf = pymupdf.open(stream=file_data if isinstance(file_data, bytes) else file_data.read(), filetype="pdf")
+        return pdf.page_count, lambda i: pdf[i].get_text("text"), pdf.close
+
+    if PDFIUM_SUPPORT:
+        pdf = pdfium.PdfDocument(file_data)
+
+        def page_text(i):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            try:
+                return textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+
+        return len(pdf), page_text, pdf.close
+
+    pdf_reader = PyPDF2.PdfReader(BytesIO(file_data) if isinstance(file_data, bytes) else file_data)
+    return len(pdf_reader.pages), lambda i: pdf_reader.pages[i].extract_text(), lambda: None
+
+
+def read_capped(stream, limit):
+    """Reads at most limit bytes from a binary stream, in bounded chunks."""
+    chunks = []
+    total = 0
+    while total < limit:
+        chunk = stream.read(min(READ_CHUNK_SIZE, limit - total))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        total += len(chunk)
+    return b"".join(chunks)
+
+def txt_read_limit(budget):
+    """Number of bytes of a TXT file needed to fill a budget of characters (UTF-8 is at most 4 bytes each)."""
+    return min(MAX_TEXT_SIZE_BYTES, (budget + EXTRACTION_SLACK_CHARS) * 4)
+
+def extract_text_from_file(filename, file_data, budget=MAX_API_CONTEXT_SIZE):
+    """
+    Extract text from an uploaded TXT or PDF file, given either its raw bytes
+    or a seekable binary stream positioned at the start of the file.
+    Extraction stops once roughly budget characters have been collected, since
+    anything beyond that is truncated before reaching the API anyway; with no
+    budget left the file is not opened at all.
+    """
+    if budget <= 0:
+        return CONTEXT_FULL_NOTE
+
     extension = filename.rsplit(".", 1)[1].lower()
     
-    file.seek(0)
-    file_bytes = file.read()
-    
     if extension == "txt":
         try:
-            if len(file_bytes) > MAX_TEXT_SIZE_BYTES:
-                file_bytes = file_bytes[:MAX_TEXT_SIZE_BYTES]
+            if isinstance(file_data, bytes):
+                file_bytes = file_data[:txt_read_limit(budget)]
+            else:
+                file_bytes = read_capped(file_data, txt_read_limit(budget))
                 
             return file_bytes.decode("utf-8", errors="ignore")
         except Exception as e:
@@ -68,25 +232,32 @@ def extract_text_from_file(file):
     
     elif extension == "pdf" and PDF_SUPPORT:
         try:
-            pdf_file = BytesIO(file_bytes)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            total_pages = len(pdf_reader.pages)
+            total_pages, get_page_text, close_pdf = open_pdf(file_data)
+            text_parts = []
+            running_len = 0
+            truncated = False
+            text_limit = budget + EXTRACTION_SLACK_CHARS
             pages_to_process = min(total_pages, MAX_PDF_PAGES)
             
             for i in range(pages_to_process):
                 try:
-                    page = pdf_reader.pages[i]
-                    page_text = page.extract_text()
+                    page_text = get_page_text(i)
                     if page_text:
-                        text += page_text + "\n"
+                        text_parts.append(page_text)
+                        text_parts.append("\n")
+                        running_len += len(page_text) + 1
                         
-                    if len(text) > MAX_API_CONTEXT_SIZE * 2: 
-                        text = text[:MAX_API_CONTEXT_SIZE * 2] + "\n[Content truncated due to size limit during extraction]"
+                    if running_len >= text_limit:
+                        truncated = True
                         break
                 except Exception as page_e:
                     print(f"Warning: Failed to extract text from page {i+1} of {filename}. Error: {page_e}")
                     continue
+
+            close_pdf()
+            text = "".join(text_parts)
+            if truncated:
+                text = text[:text_limit] + "\n[Content truncated due to size limit during extraction]"
             
             if pages_to_process < total_pages:
                 text += f"\n[Note: PDF has {total_pages} pages, processed first {pages_to_process} pages]"
@@ -100,24 +271,78 @@ def extract_text_from_file(file):
             return f"[PDF parsing failed for {filename}. The file may be corrupt or non-standard. Error: {e}]"
     
     elif extension == "pdf" and not PDF_SUPPORT:
-          return "[PDF file uploaded but PyPDF2 library not installed for text extraction.]"
+          return "[PDF file uploaded but no PDF library (PyMuPDF, pypdfium2 or PyPDF2) installed for text extraction.]"
     
     else:
         return f"[File type .{extension} is not supported.]"
 
 
+def read_upload(filename, stream, budget):
+    """Reads an upload stream into bytes, skipping any part of a TXT file that would be discarded."""
+    stream.seek(0)
+    if filename.rsplit(".", 1)[1].lower() == "txt":
+        return read_capped(stream, txt_read_limit(budget))
+    return stream.read()
+
+
+def extract_texts(uploads, budget):
+    """
+    Extracts text for a list of (filename, stream) pairs, preserving order, within a
+    shared budget of characters. Multi-file uploads are spread across processes since
+    PDF parsing is CPU-bound; each of those files may end up first, so each gets the
+    whole budget. A failed extraction yields its exception in place of the text.
+    """
+    if len(uploads) <= 1:
+        results = []
+        for filename, stream in uploads:
+            try:
+                stream.seek(0)
+                text = extract_text_from_file(filename, stream, budget)
+                if not text.startswith('['):
+                    budget -= len(text)
+                results.append(text)
+            except Exception as e:
+                results.append(e)
+        return results
+
+    # Streams can't be sent to worker processes, so those get the file bytes instead.
+    with ProcessPoolExecutor(max_workers=min(len(uploads), os.cpu_count() or 1)) as executor:
+        futures = [
+            executor.submit(extract_text_from_file, filename, read_upload(filename, stream, budget), budget)
+            for filename, stream in uploads
+        ]
+    return [future.exception() or future.result() for future in futures]
+
+
 def clean_and_parse_json(text, is_list=False):
     """
     Strips markdown blocks and aggressively isolates and cleans the JSON structure
     before attempting to parse it to handle common LLM output errors.
+    Responses requested in JSON mode are usually valid as-is, so those are parsed
+    directly and only fall back to the cleanup on failure.
     """
     if not text:
         return None
+
+    try:
+        parsed = orjson.loads(text) if ORJSON_SUPPORT else json.loads(text)
+    except ValueError:
+        parsed = None
+
+    if is_list and isinstance(parsed, list):
+        return parsed
+    if is_list and isinstance(parsed, dict):
+        # JSON mode wraps arrays in an object; return the array the cleanup would have isolated.
+        for value in parsed.values():
+            if isinstance(value, list):
+                return value
+    if not is_list and isinstance(parsed, dict):
+        return parsed
     
     text = text.strip()
 
     if text.startswith('```'):
-        tag_end_match = re.match(r'```[a-zA-Z]*\s*', text)
+        tag_end_match = CODE_FENCE_RE.match(text)
         if tag_end_match:
             text = text[tag_end_match.end():]
     if text.endswith('```'):
@@ -135,9 +360,14 @@ def clean_and_parse_json(text, is_list=False):
     
     json_content = text[start_index : end_index + 1]
 
-    json_content = json_content.replace('“', '"').replace('”', '"').replace("‘", "'").replace("’", "'")
-    json_content = json_content.replace('\xa0', ' ').replace('\u00A0', ' ')
-    json_content = re.sub(r'[\x00-\x1F\x7F]', '', json_content)
+    json_content = json_content.translate(JSON_CLEANUP_TABLE)
+
+    if ORJSON_SUPPORT:
+        try:
+            return orjson.loads(json_content)
+        except orjson.JSONDecodeError:
+            # Fall back to the stdlib parser, whose error messages drive the repair below.
+            pass
     
     try:
         return json.loads(json_content)
@@ -147,8 +377,7 @@ def clean_and_parse_json(text, is_list=False):
         
         if "Expecting ',' delimiter" in str(e) or "Extra data" in str(e):
             try:
-                re_pattern = r',\s*([}\]])'
-                fixed_content = re.sub(re_pattern, r'\1', json_content)
+                fixed_content = TRAILING_COMMA_RE.sub(r'\1', json_content)
                 print("Attempting to fix trailing comma error...")
                 return json.loads(fixed_content)
             except json.JSONDecodeError:
@@ -157,8 +386,160 @@ def clean_and_parse_json(text, is_list=False):
         return None
 
 
+def llm_cache_key(**params):
+    """Builds a deterministic cache key from everything that determines an LLM response."""
+    payload = json.dumps({"m": GEMINI_MODEL, "s": SYSTEM_CONTENT, **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def llm_cache_get(key):
+    """Returns the cached response for key, or None on a miss or cache backend failure."""
+    if redis_client is not None:
+        try:
+            value = redis_client.get(key)
+            return value.decode("utf-8") if value is not None else None
+        except Exception as e:
+            print(f"⚠️ Redis cache read failed: {e}")
+            return None
+
+    with llm_cache_lock:
+        return llm_cache.get(key)
+
+
+def llm_cache_set(key, value):
+    """Stores a response under key; cache backend failures never fail the request."""
+    if redis_client is not None:
+        try:
+            redis_client.setex(key, LLM_CACHE_TTL_SECONDS, value)
+        except Exception as e:
+            print(f"⚠️ Redis cache write failed: {e}")
+        return
+
+    with llm_cache_lock:
+        llm_cache[key] = value
+
+
+def count_llm_cache_lookup(hit):
+    with llm_cache_lock:
+        llm_cache_stats["hits" if hit else "misses"] += 1
+
+
+def cached_llm_call(func):
+    """Short-circuits identical LLM calls (same model, system prompt, prompt and parameters)."""
+    signature = inspect.signature(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = llm_cache_key(**bound.arguments)
+
+        cached = llm_cache_get(key)
+        count_llm_cache_lookup(hit=cached is not None)
+        if cached is not None:
+            print("⚡ LLM cache hit, skipping Gemini API call")
+            return cached
+
+        output_text = func(*args, **kwargs)
+        if output_text:
+            llm_cache_set(key, output_text)
+        return output_text
+
+    return wrapper
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache of generated study sets keyed by the embedding of the
+    study material, so near-duplicate uploads reuse a previous explanation and quiz.
+    """
+
+    def __init__(self, model_name, threshold, maxsize, path):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._model = None
+        self._vectors = None
+        self._payloads = []
+        self._lock = threading.Lock()
+
+    def _embed(self, text):
+        if self._model is None:
+            self._model = SentenceTransformer(self.model_name)
+        return self._model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+    def lookup(self, text):
+        """
+        Returns (payload, vector). payload is None on a miss; vector is None if the
+        text could not be embedded, in which case the result should not be stored.
+        """
+        try:
+            vector = self._embed(text)
+        except Exception as e:
+            print(f"⚠️ Semantic cache embedding failed: {e}")
+            return None, None
+
+        with self._lock:
+            if self._vectors is not None and len(self._vectors):
+                # Vectors are normalized, so the inner product is the cosine similarity.
+                scores = self._vectors @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    return self._payloads[best], vector
+            self.misses += 1
+        return None, vector
+
+    def add(self, vector, payload):
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = vector[np.newaxis, :]
+            else:
+                self._vectors = np.vstack([self._vectors, vector])[-self.maxsize:]
+            self._payloads = (self._payloads + [payload])[-self.maxsize:]
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                vectors = data["vectors"]
+                payloads = json.loads(str(data["payloads"]))
+            with self._lock:
+                self._vectors = vectors
+                self._payloads = payloads
+            print(f"Loaded {len(payloads)} semantic cache entries from {self.path}")
+        except Exception as e:
+            print(f"⚠️ Failed to load semantic cache from {self.path}: {e}")
+
+    def save(self):
+        with self._lock:
+            if self._vectors is None:
+                return
+            vectors = self._vectors
+            payloads = json.dumps(self._payloads)
+        try:
+            np.savez(self.path, vectors=vectors, payloads=np.array(payloads))
+        except Exception as e:
+            print(f"⚠️ Failed to save semantic cache to {self.path}: {e}")
+
+
+semantic_cache = None
+if SEMANTIC_CACHE_SUPPORT:
+    semantic_cache = SemanticCache(SEMANTIC_CACHE_MODEL, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAXSIZE, SEMANTIC_CACHE_PATH)
+    semantic_cache.load()
+    atexit.register(semantic_cache.save)
+
+
 # Gemini API Call Function (via OpenAI client)
-def call_openai_api(prompt, max_tokens=2000):
+@cached_llm_call
+def call_openai_api(prompt, max_tokens=1500, temperature=0.0):
     """Call the Gemini API using the OpenAI SDK and the compatible endpoint."""
     if client is None:
         print("❌ API client not initialized.")
@@ -171,21 +552,14 @@ def call_openai_api(prompt, max_tokens=2000):
         
         print("➡ Sending prompt to Gemini 2.5 Flash API via OpenAI client...")
 
-        system_content = (
-            "You are an educational AI assistant. You MUST respond with ONLY valid, well-formed JSON, "
-            "and no other conversational text. Do NOT wrap the JSON in markdown backticks (```json). "
-            "For all mathematical or special symbols, such as square root, pi, or summation, "
-            "YOU MUST USE THE ACTUAL UNICODE SYMBOL (e.g., √, π, Σ) and NOT text shortcuts (like sqrt, pi, sum)."
-        )
-        
         response = client.chat.completions.create(
-            model="gemini-2.5-flash-lite", 
+            model=GEMINI_MODEL, 
             messages=[
-                {"role": "system", "content": system_content},
+                {"role": "system", "content": SYSTEM_CONTENT},
                 {"role": "user", "content": prompt}
             ],
             max_tokens=max_tokens,
-            temperature=0.7, 
+            temperature=temperature, 
             response_format={ "type": "json_object" } 
         )
         
@@ -197,75 +571,185 @@ def call_openai_api(prompt, max_tokens=2000):
         traceback.print_exc()
         return None
 
-# Routes
-@app.route("/")
-def index():
-    return send_from_directory("public", "index.html")
+def stream_openai_api(prompt, max_tokens=1500, temperature=0.0):
+    """
+    Streaming counterpart of call_openai_api: yields the response text as it is generated.
+    Shares the response cache with call_openai_api, so a cached response is yielded in one piece.
+    """
+    if client is None:
+        print("❌ API client not initialized.")
+        return
 
-@app.route("/<path:path>")
-def serve_static(path):
-    return send_from_directory("public", path)
+    if not prompt.strip():
+        print("⚠️ Empty prompt, skipping API call")
+        return
 
-@app.errorhandler(413)
-def request_entity_too_large(error):
-    return jsonify({"error": "File size exceeds 50MB limit."}), 413
+    key = llm_cache_key(prompt=prompt, max_tokens=max_tokens, temperature=temperature)
+    cached = llm_cache_get(key)
+    count_llm_cache_lookup(hit=cached is not None)
+    if cached is not None:
+        print("⚡ LLM cache hit, skipping Gemini API call")
+        yield cached
+        return
 
-@app.route("/api/process-files", methods=["POST"])
-def process_files():
+    output_parts = []
     try:
-        if "files" not in request.files:
-            return jsonify({"error": "No files provided"}), 400
+        print("➡ Streaming prompt to Gemini 2.5 Flash API via OpenAI client...")
 
-        files = request.files.getlist("files")
-        if not files or files[0].filename == "":
-            return jsonify({"error": "No files selected"}), 400
+        response = client.chat.completions.create(
+            model=GEMINI_MODEL, 
+            messages=[
+                {"role": "system", "content": SYSTEM_CONTENT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=temperature, 
+            response_format={ "type": "json_object" },
+            stream=True
+        )
 
-        combined_text = ""
-        processed_files = []
-        errors = []
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                output_parts.append(delta)
+                yield delta
 
-        for file in files:
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                
-                try:
-                    text = extract_text_from_file(file)
-                    
-                    if text and text.startswith('['):
-                         errors.append(f"{filename}: {text}")
-                    elif text:
-                        combined_text += f"\n\n--- Content from {filename} ---\n\n{text}"
-                        processed_files.append(filename)
-                    else:
-                        errors.append(f"{filename}: Could not extract text (returned empty content).")
-
-                except Exception as e:
-                    errors.append(f"{filename}: Processing error: {str(e)}")
-            else:
-                 if file and file.filename:
-                    errors.append(f"{file.filename}: File type not supported. Only PDF and TXT are supported.")
-        
-        if not combined_text.strip():
-            error_msg = "Could not extract usable text from files."
-            if errors:
-                error_msg += " Detailed errors: " + " | ".join(errors)
-            return jsonify({"error": error_msg}), 400
+        print("✅ Received streamed response from Gemini API")
+    except Exception as e:
+        print(f"❌ Gemini API error: {e}")
+        traceback.print_exc()
+        return
+
+    output_text = "".join(output_parts)
+    if output_text:
+        llm_cache_set(key, output_text)
+
+
+def parse_streamed_paragraphs(buffer, pos):
+    """
+    Decodes the strings of the "content" array that have been completed so far in a
+    partially streamed explanation. pos is where the previous call stopped (None until
+    the array has been found). Returns (new_paragraphs, pos).
+    """
+    paragraphs = []
+    if pos is None:
+        match = CONTENT_ARRAY_RE.search(buffer)
+        if not match:
+            return paragraphs, None
+        pos = match.end()
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buffer) or buffer[pos] != '"':
+            return paragraphs, pos
+        try:
+            paragraph, pos = JSON_DECODER.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The string is still being generated.
+            return paragraphs, pos
+        paragraphs.append(paragraph)
+
+
+def ojsonify(obj):
+    """Like jsonify, but serializes with orjson when it is installed."""
+    if not ORJSON_SUPPORT:
+        return jsonify(obj)
+    return Response(orjson.dumps(obj), mimetype="application/json")
+
+
+def sse_event(event, data):
+    """Formats a Server-Sent Event with a JSON payload."""
+    payload = orjson.dumps(data).decode("utf-8") if ORJSON_SUPPORT else json.dumps(data)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def load_study_material():
+    """
+    Extracts and combines the text of the files uploaded with the current request.
+    Returns ((combined_text, processed_files, errors), None) on success, or
+    (None, error_response) if no usable text could be extracted.
+    """
+    if "files" not in request.files:
+        return None, (jsonify({"error": "No files provided"}), 400)
+
+    files = request.files.getlist("files")
+    if not files or files[0].filename == "":
+        return None, (jsonify({"error": "No files selected"}), 400)
+
+    combined_parts = []
+    combined_len = 0
+    truncated = False
+    processed_files = []
+    errors = []
+
+    uploads = []
+    upload_names = []
+    for file in files:
+        if file and allowed_file(file.filename):
+            uploads.append((file.filename, file.stream))
+            upload_names.append(secure_filename(file.filename))
+        else:
+             if file and file.filename:
+                errors.append(f"{file.filename}: File type not supported. Only PDF and TXT are supported.")
+
+    for filename, text in zip(upload_names, extract_texts(uploads, MAX_API_CONTEXT_SIZE - combined_len)):
+        if isinstance(text, Exception):
+            errors.append(f"{filename}: Processing error: {str(text)}")
+        elif text and text.startswith('['):
+             errors.append(f"{filename}: {text}")
+        elif text:
+            header = f"\n\n--- Content from {filename} ---\n\n"
+            remaining = MAX_API_CONTEXT_SIZE - combined_len - len(header)
+            if remaining <= 0:
+                # Extracted in parallel before the earlier files had filled the budget.
+                errors.append(f"{filename}: {CONTEXT_FULL_NOTE}")
+                continue
+
+            # Extraction already stopped near the budget, so this only trims the slack.
+            if len(text) > remaining:
+                text = text[:remaining]
+                truncated = True
+            combined_parts.append(header)
+            combined_parts.append(text)
+            combined_len += len(header) + len(text)
+            processed_files.append(filename)
+        else:
+            errors.append(f"{filename}: Could not extract text (returned empty content).")
+
+    if not combined_parts:
+        error_msg = "Could not extract usable text from files."
+        if errors:
+            error_msg += " Detailed errors: " + " | ".join(errors)
+        return None, (jsonify({"error": error_msg}), 400)
+
+    if truncated:
+        combined_parts.append("\n\n[...Content truncated for API processing efficiency]")
+    combined_text = "".join(combined_parts)
+
+    return (combined_text, processed_files, errors), None
 
-        if len(combined_text) > MAX_API_CONTEXT_SIZE:
-            combined_text = combined_text[:MAX_API_CONTEXT_SIZE] + "\n\n[...Content truncated for API processing efficiency]"
 
-        explanation_prompt = f"""You are an educational AI assistant. Follow ALL instructions exactly as written.
+def study_material_prefix(combined_text):
+    """
+    Opening block shared by every prompt. It is kept first and byte-identical so the
+    provider's prompt-prefix cache can reuse it across the explanation and quiz calls.
+    """
+    return f"Study Material:\n{combined_text}\n\n---\n"
+
 
-You will analyze the following study material and produce a structured explanation.  
+def build_explanation_prompt(combined_text):
+    return study_material_prefix(combined_text) + """TASK: You are an educational AI assistant. Follow ALL instructions exactly as written.
+
+You will analyze the study material above and produce a structured explanation.  
 You MUST follow the formatting rules exactly.  
 You MUST NOT add any extra text, comments, disclaimers, apologies, introductions, conclusions, or explanations outside of the required JSON.  
 You MUST NOT use markdown formatting.  
 You MUST NOT wrap the JSON in backticks or code blocks.  
 You MUST ONLY return valid JSON as the final output.
 
-Study Material:
-{combined_text}
-
 Your task:
 
 1. Create a clear, concise topic/title for the material.
@@ -273,7 +757,7 @@ Your task:
     Each paragraph must summarize a different key idea, concept, or section from the study material.
 3. Return the output **only** in this JSON structure:
 
-{{
+{
   "topic": "Topic Title Here",
   "content": [
     "First paragraph of explanation...",
@@ -282,7 +766,7 @@ Your task:
     "Fourth paragraph of explanation...",
     "Fifth paragraph of explanation..."
   ]
-}}
+}
 
 Formatting Rules (MANDATORY):
 - The JSON MUST be valid and properly formatted.
@@ -296,24 +780,9 @@ Formatting Rules (MANDATORY):
 If you understand, output ONLY the JSON object following all rules above.
 """
 
-        explanation_text = call_openai_api(explanation_prompt)
-        explanation_data = None
-        
-        if explanation_text:
-            explanation_data = clean_and_parse_json(explanation_text, is_list=False)
-        
-        if explanation_data is None:
-            explanation_data = {
-                "topic": "Study Material Analysis (Failed to Parse JSON)",
-                "content": explanation_text.split('\n\n')[:5] if explanation_text else ["Unable to generate explanation or parse response."]
-            }
-        
-        explanation_for_storage = [explanation_data] if isinstance(explanation_data, dict) else explanation_data
 
-        quiz_prompt = f"""Based on this study material, create 10 multiple-choice questions that thoroughly test understanding of all the important concepts.
-
-Study Material:
-{combined_text}
+def build_quiz_prompt(combined_text):
+    return study_material_prefix(combined_text) + """TASK: Based on the study material above, create 10 multiple-choice questions that thoroughly test understanding of all the important concepts.
 
 Create questions with:
 - Clear, concise questions
@@ -322,7 +791,7 @@ Create questions with:
 
 Format your response as a JSON array of question objects, ensuring you generate exactly 10 questions:
 [
-  {{
+  {
     "question": "Question text here?",
     "options": [
       "A) First option",
@@ -331,61 +800,282 @@ Format your response as a JSON array of question objects, ensuring you generate
       "D) Fourth option"
     ],
     "correctAnswer": "B"
-  }},
-  {{
+  },
+  {
     "question": "Another question?",
     "options": ["A) Option A", "B) Option B", "C) Option C", "D) Option D"],
     "correctAnswer": "A"
-  }}
+  }
   // ... continue for 10 total questions
 ]
 
 Only return the JSON array, no additional text or characters. DO NOT include the JSON in markdown backticks (```json)."""
 
-        quiz_text = call_openai_api(quiz_prompt)
-        quiz_data = None
-        quiz_status_message = "Success"
-        
-        if quiz_text:
-            temp_quiz_data = clean_and_parse_json(quiz_text, is_list=True)
-            
-            if temp_quiz_data:
-                if not isinstance(temp_quiz_data, list):
-                    if isinstance(temp_quiz_data, dict) and 'quiz' in temp_quiz_data and isinstance(temp_quiz_data['quiz'], list):
-                        temp_quiz_data = temp_quiz_data['quiz']
-                    elif isinstance(temp_quiz_data, dict) and 'questions' in temp_quiz_data and isinstance(temp_quiz_data['questions'], list):
-                        temp_quiz_data = temp_quiz_data['questions']
-                    else:
-                        temp_quiz_data = [temp_quiz_data] 
-
-                valid_questions = []
-                for q in temp_quiz_data:
-                    if (isinstance(q, dict) and 
-                        q.get('question') and 
-                        q.get('options') and 
-                        q.get('correctAnswer') and
-                        isinstance(q['options'], list) and
-                        len(q['options']) >= 4):
-                        
-                        valid_questions.append(q)
+
+def build_study_set_prompt(combined_text):
+    return study_material_prefix(combined_text) + """TASK: You are an educational AI assistant. Follow ALL instructions exactly as written.
+
+You will analyze the study material above and produce a structured explanation and a multiple-choice quiz.  
+You MUST follow the formatting rules exactly.  
+You MUST NOT add any extra text, comments, disclaimers, apologies, introductions, conclusions, or explanations outside of the required JSON.  
+You MUST NOT use markdown formatting.  
+You MUST NOT wrap the JSON in backticks or code blocks.  
+You MUST ONLY return valid JSON as the final output.
+
+Your task:
+
+1. Create a clear, concise topic/title for the material.
+2. Create **exactly 5 paragraphs** of explanation in simple, educational language.  
+    Each paragraph must summarize a different key idea, concept, or section from the study material.
+3. Create **exactly 10 multiple-choice questions** that thoroughly test understanding of all the important concepts.  
+    Each question must be clear and concise, with exactly 4 answer options labeled A, B, C, D and one correct answer.
+4. Return the output **only** in this JSON structure:
+
+{
+  "explanation": {
+    "topic": "Topic Title Here",
+    "content": [
+      "First paragraph of explanation...",
+      "Second paragraph of explanation...",
+      "Third paragraph of explanation...",
+      "Fourth paragraph of explanation...",
+      "Fifth paragraph of explanation..."
+    ]
+  },
+  "quiz": [
+    {
+      "question": "Question text here?",
+      "options": [
+        "A) First option",
+        "B) Second option",
+        "C) Third option",
+        "D) Fourth option"
+      ],
+      "correctAnswer": "B"
+    }
+  ]
+}
+
+Formatting Rules (MANDATORY):
+- The JSON MUST be valid and properly formatted.
+- The "topic" field MUST be a single string.
+- The "content" field MUST be an array containing EXACTLY 5 strings.
+- The "quiz" field MUST be an array containing EXACTLY 10 question objects.
+- The "correctAnswer" field MUST be the letter (A, B, C or D) of the correct option.
+- Do NOT include extra fields.
+- Do NOT include trailing commas.
+- Do NOT include any text before or after the JSON object.
+
+If you understand, output ONLY the JSON object following all rules above.
+"""
+
+
+def parse_explanation(explanation_text):
+    """
+    Parses the explanation response into the list stored by the frontend.
+    Returns (explanation, parsed); parsed is False if a fallback explanation was used.
+    """
+    explanation_data = None
+    
+    if explanation_text:
+        explanation_data = clean_and_parse_json(explanation_text, is_list=False)
+    
+    explanation_parsed = explanation_data is not None
+    if explanation_data is None:
+        explanation_data = {
+            "topic": "Study Material Analysis (Failed to Parse JSON)",
+            "content": explanation_text.split('\n\n')[:5] if explanation_text else ["Unable to generate explanation or parse response."]
+        }
+    
+    explanation_for_storage = [explanation_data] if isinstance(explanation_data, dict) else explanation_data
+    return explanation_for_storage, explanation_parsed
+
+
+def parse_quiz(quiz_text):
+    """Parses and validates the quiz response. Returns (quiz_data, quiz_status_message)."""
+    return validate_quiz(clean_and_parse_json(quiz_text, is_list=True) if quiz_text else None)
+
+
+def validate_quiz(temp_quiz_data):
+    """Keeps the well-formed questions of parsed quiz data. Returns (quiz_data, quiz_status_message)."""
+    quiz_data = None
+    quiz_status_message = "Success"
+    
+    if temp_quiz_data:
+        if not isinstance(temp_quiz_data, list):
+            if isinstance(temp_quiz_data, dict) and 'quiz' in temp_quiz_data and isinstance(temp_quiz_data['quiz'], list):
+                temp_quiz_data = temp_quiz_data['quiz']
+            elif isinstance(temp_quiz_data, dict) and 'questions' in temp_quiz_data and isinstance(temp_quiz_data['questions'], list):
+                temp_quiz_data = temp_quiz_data['questions']
+            else:
+                temp_quiz_data = [temp_quiz_data] 
+
+        valid_questions = []
+        for q in temp_quiz_data:
+            if (isinstance(q, dict) and 
+                q.get('question') and 
+                q.get('options') and 
+                q.get('correctAnswer') and
+                isinstance(q['options'], list) and
+                len(q['options']) >= 4):
                 
-                quiz_data = valid_questions
-            
-        # Final Quiz Fallback
-        if quiz_data is None or len(quiz_data) < 5:
-            quiz_status_message = f"Failed to generate enough valid questions (parsed only {len(quiz_data) if quiz_data else 0}). Explanation generated successfully."
-            quiz_data = [
-                {
-                    "question": "Quiz generation failed (Error: Not enough valid questions generated).",
-                    "options": ["A) Please check the content.", "B) Try re-uploading the file.", "C) The material might be too short or complex.", "D) All of the above."],
-                    "correctAnswer": "D"
-                }
-            ]
+                valid_questions.append(q)
+        
+        quiz_data = valid_questions
+        
+    # Final Quiz Fallback
+    if quiz_data is None or len(quiz_data) < 5:
+        quiz_status_message = f"Failed to generate enough valid questions (parsed only {len(quiz_data) if quiz_data else 0}). Explanation generated successfully."
+        quiz_data = [
+            {
+                "question": "Quiz generation failed (Error: Not enough valid questions generated).",
+                "options": ["A) Please check the content.", "B) Try re-uploading the file.", "C) The material might be too short or complex.", "D) All of the above."],
+                "correctAnswer": "D"
+            }
+        ]
+
+    return quiz_data, quiz_status_message
+
+
+def parse_study_set(study_set_text):
+    """
+    Splits a combined explanation + quiz response into (explanation, quiz_data, quiz_status_message).
+    Returns None if either half fails validation, so the caller can fall back to separate calls.
+    """
+    study_set = clean_and_parse_json(study_set_text, is_list=False) if study_set_text else None
+    if not isinstance(study_set, dict):
+        return None
+
+    explanation_data = study_set.get("explanation")
+    if not (isinstance(explanation_data, dict) and
+            isinstance(explanation_data.get("topic"), str) and
+            isinstance(explanation_data.get("content"), list) and
+            explanation_data["content"]):
+        return None
+
+    quiz_data, quiz_status_message = validate_quiz(study_set.get("quiz"))
+    if quiz_status_message != "Success":
+        return None
+
+    return [explanation_data], quiz_data, quiz_status_message
+
+
+def generate_separately(combined_text):
+    """
+    Generates the explanation and quiz with two concurrent Gemini calls.
+    Returns (explanation, explanation_parsed, quiz_data, quiz_status_message).
+    """
+    explanation_prompt = build_explanation_prompt(combined_text)
+    quiz_prompt = build_quiz_prompt(combined_text)
+
+    # Both calls are I/O-bound on the Gemini API, so run them concurrently.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        explanation_future = executor.submit(call_openai_api, explanation_prompt, max_tokens=EXPLANATION_MAX_TOKENS)
+        quiz_future = executor.submit(call_openai_api, quiz_prompt, max_tokens=QUIZ_MAX_TOKENS)
+        explanation_text, quiz_text = explanation_future.result(), quiz_future.result()
+
+    explanation_for_storage, explanation_parsed = parse_explanation(explanation_text)
+    quiz_data, quiz_status_message = parse_quiz(quiz_text)
+    return explanation_for_storage, explanation_parsed, quiz_data, quiz_status_message
+
+
+def generate_study_set(combined_text, study_set_text):
+    """
+    Turns the response to the combined study set prompt into
+    (explanation, explanation_parsed, quiz_data, quiz_status_message), making
+    separate explanation and quiz calls only if that response fails validation.
+    """
+    study_set = parse_study_set(study_set_text)
+    if study_set is not None:
+        explanation_for_storage, quiz_data, quiz_status_message = study_set
+        return explanation_for_storage, True, quiz_data, quiz_status_message
+
+    print("⚠️ Combined response failed validation, falling back to separate explanation and quiz calls")
+    return generate_separately(combined_text)
+
+
+def remember_study_set(semantic_vector, explanation, explanation_parsed, quiz_data, quiz_status_message):
+    """Stores a fully successful result in the semantic cache."""
+    if semantic_vector is not None and explanation_parsed and quiz_status_message == "Success":
+        semantic_cache.add(semantic_vector, {
+            "explanation": explanation,
+            "quiz": quiz_data,
+            "quiz_status": quiz_status_message
+        })
+
+
+def lookup_study_set(combined_text):
+    """Returns (cached_result, semantic_vector) from the semantic cache, if enabled."""
+    if semantic_cache is None:
+        return None, None
+    cached_result, semantic_vector = semantic_cache.lookup(combined_text)
+    if cached_result is not None:
+        print("⚡ Semantic cache hit, reusing previous explanation and quiz")
+    return cached_result, semantic_vector
+
+
+# Routes
+if not WHITENOISE_SUPPORT:
+    @app.route("/")
+    def index():
+        return send_from_directory("public", "index.html", max_age=STATIC_MAX_AGE_SECONDS)
+
+    @app.route("/<path:path>")
+    def serve_static(path):
+        return send_from_directory("public", path, max_age=STATIC_MAX_AGE_SECONDS)
+
+@app.route("/metrics")
+def metrics():
+    with llm_cache_lock:
+        stats = dict(llm_cache_stats)
+        size = len(llm_cache)
+    return jsonify({
+        "llm_cache": {
+            "backend": "redis" if redis_client is not None else "memory",
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "size": size if redis_client is None else None
+        },
+        "semantic_cache": {
+            "enabled": semantic_cache is not None,
+            "hits": semantic_cache.hits if semantic_cache is not None else 0,
+            "misses": semantic_cache.misses if semantic_cache is not None else 0,
+            "size": len(semantic_cache) if semantic_cache is not None else 0
+        }
+    })
+
+@app.errorhandler(413)
+def request_entity_too_large(error):
+    return jsonify({"error": "File size exceeds 50MB limit."}), 413
+
+@app.route("/api/process-files", methods=["POST"])
+def process_files():
+    try:
+        material, error_response = load_study_material()
+        if error_response is not None:
+            return error_response
+        combined_text, processed_files, errors = material
+
+        cached_result, semantic_vector = lookup_study_set(combined_text)
+        if cached_result is not None:
+            return ojsonify({
+                "success": True,
+                "explanation": cached_result["explanation"],
+                "quiz": cached_result["quiz"],
+                "files_processed": processed_files,
+                "quiz_status": cached_result["quiz_status"],
+                "extraction_errors": errors
+            })
+
+        study_set_text = call_openai_api(build_study_set_prompt(combined_text), max_tokens=STUDY_SET_MAX_TOKENS)
+        explanation_for_storage, explanation_parsed, quiz_data, quiz_status_message = generate_study_set(combined_text, study_set_text)
 
         print(f"Returning explanation (length: {len(explanation_for_storage)})")
         print(f"Returning quiz (length: {len(quiz_data)})")
+
+        remember_study_set(semantic_vector, explanation_for_storage, explanation_parsed, quiz_data, quiz_status_message)
         
-        return jsonify({
+        return ojsonify({
             "success": True,
             "explanation": explanation_for_storage,
             "quiz": quiz_data,
@@ -399,6 +1089,62 @@ Only return the JSON array, no additional text or characters. DO NOT include the
         print(traceback.format_exc())
         return jsonify({"error": f"An internal server error occurred during processing: {str(e)}"}), 500
 
+@app.route("/api/process-files/stream", methods=["POST"])
+def process_files_stream():
+    """
+    Same as /api/process-files, but responds with Server-Sent Events: a "paragraph"
+    event for each explanation paragraph as soon as Gemini has generated it, then
+    "explanation", and finally "done" carrying the same payload as /api/process-files.
+    Paragraphs from a combined response that fails validation are superseded by the
+    "explanation" event from the fallback calls.
+    """
+    try:
+        material, error_response = load_study_material()
+        if error_response is not None:
+            return error_response
+        combined_text, processed_files, errors = material
+    except Exception as e:
+        print(f"Error in process_files_stream: {e}")
+        print(traceback.format_exc())
+        return jsonify({"error": f"An internal server error occurred during processing: {str(e)}"}), 500
+
+    def generate():
+        try:
+            cached_result, semantic_vector = lookup_study_set(combined_text)
+            if cached_result is not None:
+                explanation_for_storage = cached_result["explanation"]
+                quiz_data, quiz_status_message = cached_result["quiz"], cached_result["quiz_status"]
+                yield sse_event("explanation", {"explanation": explanation_for_storage})
+            else:
+                study_set_text = ""
+                paragraph_pos = None
+                for chunk in stream_openai_api(build_study_set_prompt(combined_text), max_tokens=STUDY_SET_MAX_TOKENS):
+                    study_set_text += chunk
+                    paragraphs, paragraph_pos = parse_streamed_paragraphs(study_set_text, paragraph_pos)
+                    for paragraph in paragraphs:
+                        yield sse_event("paragraph", {"text": paragraph})
+
+                explanation_for_storage, explanation_parsed, quiz_data, quiz_status_message = generate_study_set(combined_text, study_set_text or None)
+                yield sse_event("explanation", {"explanation": explanation_for_storage})
+
+                remember_study_set(semantic_vector, explanation_for_storage, explanation_parsed, quiz_data, quiz_status_message)
+
+            yield sse_event("done", {
+                "success": True,
+                "explanation": explanation_for_storage,
+                "quiz": quiz_data,
+                "files_processed": processed_files,
+                "quiz_status": quiz_status_message,
+                "extraction_errors": errors
+            })
+
+        except Exception as e:
+            print(f"Error in process_files_stream: {e}")
+            print(traceback.format_exc())
+            yield sse_event("error", {"error": f"An internal server error occurred during processing: {str(e)}"})
+
+    return Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # Run server
 if __name__ == "__main__":
     if client is None: